@@ -0,0 +1,194 @@
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from api.cache import (CONTENT_KEY, dictionary_validators, feed_key,
+                       set_validators)
+from api.search import ingredient_index
+
+# Сколько байт потокового ответа держится в памяти до записи на диск.
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def render(data):
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    return HttpResponse(renderer.render(data), content_type=content_type)
+
+
+def is_anonymous(request):
+    # Токен проверяет синхронное представление: неверный токен - 401.
+    return 'HTTP_AUTHORIZATION' not in request.META
+
+
+def recipe_feed(request):
+    """Страница ленты анонимного пользователя из кэша."""
+    if not is_anonymous(request):
+        return None
+    data = cache.get(feed_key(request))
+    return None if data is None else render(data)
+
+
+def dictionary_content(request, cache_name, version):
+    if request.GET:
+        return None
+    content = cache.get(CONTENT_KEY.format(cache_name, version))
+    if content is None:
+        return None
+    return HttpResponse(content, content_type='application/json')
+
+
+def ingredient_content(request, cache_name, version):
+    name = request.GET.get('name')
+    if name is None:
+        return dictionary_content(request, cache_name, version)
+    limit = request.GET.get('limit')
+    if (set(request.GET) - {'name', 'limit'}
+            or limit is not None and not limit.isdigit()
+            or not ingredient_index.is_current()):
+        return None
+    return render(ingredient_index.find(
+        name,
+        limit=int(limit) if limit is not None else None))
+
+
+def dictionary(cache_name, get_content):
+    """Ответ 304 или содержимое справочника без обращения к базе."""
+    def fast_path(request):
+        if not is_anonymous(request):
+            return None
+        version, etag = dictionary_validators(request, cache_name)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=version)
+        if response is None:
+            response = get_content(request, cache_name, version)
+        if response is None:
+            return None
+        return set_validators(response, version, etag)
+    return fast_path
+
+
+# Маршруты DefaultRouter, которые обслуживаются асинхронно,
+# и ответы из кэша для них.
+ASYNC_ROUTES = {
+    'recipes-list': recipe_feed,
+    'recipes-detail': None,
+    'recipes-download-shopping-cart': None,
+    'tags-list': dictionary('tags', dictionary_content),
+    'tags-detail': None,
+    'ingredients-list': dictionary('ingredients', ingredient_content),
+    'ingredients-detail': None,
+}
+
+
+def spool(streaming):
+    """Потоковый ответ, записанный во временный файл.
+
+    Django 3.2 читает потоковый ответ в цикле событий, где запросы
+    к базе запрещены. Содержимое собирается в потоке пула, а файл цикл
+    событий читает частями, и память не растёт с размером ответа.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        for chunk in streaming.streaming_content:
+            file.write(chunk)
+    except BaseException:
+        file.close()
+        raise
+    finally:
+        streaming.close()
+    size = file.tell()
+    file.seek(0)
+    response = FileResponse(file, status=streaming.status_code)
+    for header, value in streaming.items():
+        response[header] = value
+    response['Content-Length'] = size
+    return response
+
+
+def run_sync(view, request, kwargs):
+    """Синхронное представление целиком в потоке пула.
+
+    Соединения потоков пула закрываются так же, как обработчик WSGI
+    закрывает их в начале и в конце запроса.
+    """
+    close_old_connections()
+    try:
+        response = view(request, **kwargs)
+        if response.streaming:
+            response = spool(response)
+        elif callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def allowed_methods(actions):
+    # Заголовок Allow, как его формирует APIView.
+    methods = set(actions) | {'options'}
+    if 'get' in methods:
+        methods.add('head')
+    return ', '.join(
+        method.upper() for method in APIView.http_method_names
+        if method in methods)
+
+
+def accepts_json(request, kwargs):
+    # Страницу браузерного API строит синхронный путь.
+    return ('format' not in kwargs and 'format' not in request.GET
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', ''))
+
+
+def async_view(view, fast_path=None):
+    """Асинхронная обёртка над представлением DRF.
+
+    GET-запросы, на которые есть ответ в кэше, обслуживаются в цикле
+    событий без потоков. Остальные запросы выполняются одним вызовом
+    представления в общем пуле потоков: все запросы к базе и
+    сериализация проходят за один переход, а цикл событий тем временем
+    отдаёт ответы медленным клиентам.
+    """
+    run = sync_to_async(run_sync, thread_sensitive=False)
+    endpoint = '{0}.{1}'.format(
+        view.initkwargs['basename'], view.actions.get('get'))
+    allow = allowed_methods(view.actions)
+
+    async def handler(request, **kwargs):
+        if (fast_path is not None and request.method == 'GET'
+                and accepts_json(request, kwargs)):
+            response = fast_path(request)
+            if response is not None:
+                metrics = getattr(request, 'metrics', None)
+                if metrics is not None:
+                    metrics.endpoint = endpoint
+                response['Allow'] = allow
+                patch_vary_headers(response, ('Accept',))
+                return response
+        return await run(view, request, kwargs)
+
+    # csrf_exempt в Django 3.2 не поддерживает асинхронные функции.
+    handler.csrf_exempt = True
+    return handler
+
+
+def async_routes(patterns):
+    """Маршруты роутера, где чтение обслуживают асинхронные представления."""
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_view(pattern.callback, ASYNC_ROUTES[pattern.name]),
+            pattern.default_args,
+            pattern.name)
+        if pattern.name in ASYNC_ROUTES else pattern
+        for pattern in patterns
+    ]
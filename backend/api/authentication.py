@@ -0,0 +1,156 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+SHARED_KEY = 'auth_token:{0}'
+GENERATION_KEY = 'auth_token_generation:{0}'
+
+
+class LRUCache:
+    """Кэш процесса с ограничением размера и временем жизни записей."""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+token_cache = LRUCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT)
+
+
+def token_cache_key(key):
+    # Сам токен не попадает в ключи общего кэша.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def copy_token(token):
+    """Копия токена и пользователя: запрос может изменить пользователя."""
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+def current_generation(cache_key):
+    """Поколение токена в общем кэше, без TOKEN_CACHE_SHARED - None."""
+    if not settings.TOKEN_CACHE_SHARED:
+        return None
+    return cache.get(GENERATION_KEY.format(cache_key))
+
+
+def forget_token(key):
+    """Удаление токена из кэша.
+
+    Запись этого процесса удаляется сразу. С TOKEN_CACHE_SHARED новое
+    поколение токена делает недействительными записи других процессов.
+    """
+    cache_key = token_cache_key(key)
+    token_cache.delete(cache_key)
+    if settings.TOKEN_CACHE_SHARED:
+        cache.delete(SHARED_KEY.format(cache_key))
+        # Поколение хранится дольше любой записи, созданной до него.
+        cache.set(
+            GENERATION_KEY.format(cache_key),
+            uuid.uuid4().hex,
+            3 * settings.TOKEN_CACHE_TIMEOUT)
+
+
+def forget_user_tokens(user_id):
+    """Удаление из кэша токенов пользователя.
+
+    Без TOKEN_CACHE_SHARED записи в памяти других процессов живут
+    не дольше TOKEN_CACHE_TIMEOUT.
+    """
+    for key in Token.objects.filter(user_id=user_id).values_list(
+            'key', flat=True):
+        forget_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для известных токенов.
+
+    Кэш используется только безопасными запросами (GET, HEAD, OPTIONS).
+
+    Токен с пользователем хранится в LRU-кэше процесса, а при
+    TOKEN_CACHE_SHARED и в общем кэше Django вместе с поколением токена.
+    Записи удаляются сигналами при выходе, смене пароля и деактивации
+    пользователя; в общем режиме каждое попадание сверяется с текущим
+    поколением, поэтому удаление видно всем процессам сразу.
+    """
+
+    use_cache = True
+
+    def authenticate(self, request):
+        # Изменяющие запросы получают пользователя из базы: djoser
+        # сохраняет request.user целиком, и устаревшая копия из кэша
+        # перезаписала бы изменения, сделанные в других процессах.
+        self.use_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def cached_entry(self, cache_key, generation):
+        """Запись кэша процесса или общего кэша текущего поколения."""
+        entry = token_cache.get(cache_key)
+        if entry is None and settings.TOKEN_CACHE_SHARED:
+            entry = cache.get(SHARED_KEY.format(cache_key))
+            if entry is not None and entry[1] == generation:
+                token_cache.set(cache_key, entry)
+        if entry is None or entry[1] != generation:
+            return None
+        return entry
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        # Поколение читается до обращения к базе: если сигнал сменит его
+        # во время загрузки, запись со старым поколением не будет принята.
+        generation = current_generation(cache_key)
+        entry = (self.cached_entry(cache_key, generation)
+                 if self.use_cache else None)
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            entry = (copy_token(token), generation)
+            token_cache.set(cache_key, entry)
+            if settings.TOKEN_CACHE_SHARED:
+                cache.set(
+                    SHARED_KEY.format(cache_key),
+                    entry,
+                    settings.TOKEN_CACHE_TIMEOUT)
+            return user, token
+        token = copy_token(entry[0])
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return token.user, token
@@ -0,0 +1,174 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from recipes.models import Tag
+
+from api.renderers import ORJSONRenderer
+
+VERSION_KEY = 'dictionary_version:{0}'
+CONTENT_KEY = 'dictionary_content:{0}:{1}'
+CONTENT_TIMEOUT = 60 * 60 * 24
+# Время жизни версии. С кэшем в памяти процесса bump_version из
+# команд управления не видна серверу, и версия обновляется сама;
+# в общем кэше версии хранятся бессрочно.
+VERSION_TIMEOUT = (
+    60 * 5 if settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+    else None)
+
+
+def get_version(name):
+    """Текущая версия набора данных (время последнего изменения)."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), VERSION_TIMEOUT)
+        return cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Новая версия набора данных, старые ETag и содержимое устаревают."""
+    cache.set(
+        VERSION_KEY.format(name),
+        max(int(time.time()), get_version(name) + 1),
+        VERSION_TIMEOUT)
+
+
+class CachedDictionaryMixin:
+    """Кэширование справочника и ответы 304 Not Modified.
+
+    Полный список без фильтров хранится в кэше готовыми байтами
+    и отдаётся без обращения к ORM.
+    """
+
+    cache_name = None
+
+    def list(self, request, *args, **kwargs):
+        version, etag = dictionary_validators(request, self.cache_name)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=version)
+        if response is None:
+            response = self.get_list_response(request, version)
+        return set_validators(response, version, etag)
+
+    def get_list_response(self, request, version):
+        if request.query_params:
+            return super().list(request)
+        key = CONTENT_KEY.format(self.cache_name, version)
+        content = cache.get(key)
+        if content is None:
+            serializer = self.get_serializer(
+                self.get_queryset(),
+                many=True)
+            content = ORJSONRenderer().render(serializer.data)
+            cache.set(key, content, CONTENT_TIMEOUT)
+        return HttpResponse(content, content_type='application/json')
+
+
+def dictionary_validators(request, cache_name):
+    """Версия справочника и ETag для адреса запроса."""
+    version = get_version(cache_name)
+    etag = quote_etag(hashlib.md5(
+        f'{cache_name}:{version}:{request.get_full_path()}'.encode(),
+    ).hexdigest())
+    return version, etag
+
+
+def set_validators(response, version, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version)
+    return response
+
+
+TAG_MAP_KEY = 'tag_map:{0}'
+
+
+def get_tag_map():
+    """Словарь slug -> id тегов из кэша."""
+    key = TAG_MAP_KEY.format(get_version('tags'))
+    tag_map = cache.get(key)
+    if tag_map is None:
+        tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_map, CONTENT_TIMEOUT)
+    return tag_map
+
+
+RECIPE_KEY = 'recipe:{0}:{1}'
+FEED_KEY = 'recipe_feed:{0}:{1}'
+FEED_TIMEOUT = 60
+
+
+def invalidate_recipes(recipe_ids):
+    """Удаление закэшированных рецептов и анонимных страниц ленты."""
+    version = get_version('recipes')
+    cache.delete_many(
+        [RECIPE_KEY.format(version, recipe_id) for recipe_id in recipe_ids])
+    bump_version('feed')
+
+
+def personalize(data, recipe, request, relations):
+    """Флаги пользователя и абсолютные адреса для общего представления."""
+    data = dict(data, author=dict(data['author']))
+    data['is_favorited'] = recipe.id in relations.favorites
+    data['is_in_shopping_cart'] = recipe.id in relations.shopping_cart
+    data['author']['is_subscribed'] = (
+        recipe.author_id in relations.subscriptions)
+    if data['image']:
+        data['image'] = request.build_absolute_uri(data['image'])
+    if data['image_variants']:
+        data['image_variants'] = {
+            variant: url and request.build_absolute_uri(url)
+            for variant, url in data['image_variants'].items()
+        }
+    return data
+
+
+def serialize_recipes(recipes, represent, prefetch, request, relations):
+    """Представление рецептов из кэша, без пользовательских флагов.
+
+    Связи загружаются и представление represent(recipe) строится только
+    для рецептов, которых нет в кэше; флаги пользователя берутся из
+    множеств UserRelations.
+    """
+    version = get_version('recipes')
+    keys = {
+        recipe.id: RECIPE_KEY.format(version, recipe.id)
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if missing:
+        prefetch_related_objects(missing, *prefetch)
+        # Адреса в кэше относительные, абсолютными их делает personalize.
+        fresh = {keys[recipe.id]: represent(recipe) for recipe in missing}
+        cache.set_many(fresh, CONTENT_TIMEOUT)
+        cached.update(fresh)
+    return [
+        personalize(cached[keys[recipe.id]], recipe, request, relations)
+        for recipe in recipes
+    ]
+
+
+def feed_key(request):
+    return FEED_KEY.format(
+        get_version('feed'),
+        hashlib.md5(request.build_absolute_uri().encode()).hexdigest())
+
+
+def cached_feed_page(request, get_response):
+    """Страница ленты для анонимного пользователя целиком из кэша."""
+    key = feed_key(request)
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+    response = get_response()
+    cache.set(key, response.data, FEED_TIMEOUT)
+    return response
@@ -1,8 +1,10 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
-from users.models import User
+from recipes.models import Favorite, GroceryList, Recipe
+
+from api.cache import get_tag_map
 
 
 class IngredientSearchFilter(SearchFilter):
@@ -11,23 +13,56 @@ class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
 
 
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
+
+
 class RecipeFilter(FilterSet):
     """Фильтация по тегам, авторам, наличию в избранном и покупоках."""
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
-    author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags')
+    author = filters.NumberFilter(field_name='author')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='filter_ordering')
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_tags(self, queryset, name, value):
+        """Рецепты с любым из тегов, без JOIN и повторяющихся строк."""
+        tag_map = get_tag_map()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tag_map[slug] for slug in value])))
+
+    def filter_related(self, queryset, model, value):
+        """Рецепты со связью пользователя, по индексу (user, recipe)."""
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(Exists(model.objects.filter(
+                user=self.request.user,
+                recipe_id=OuterRef('pk'))))
         return queryset
 
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_related(queryset, Favorite, value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            return queryset.filter(in_grocery_list__user=self.request.user)
+        return self.filter_related(queryset, GroceryList, value)
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по словам названия, использует триграммный индекс."""
+        for word in value.split():
+            queryset = queryset.filter(name__icontains=word)
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """Популярные рецепты по счётчику избранного."""
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-pub_date')
         return queryset
 
     class Meta:
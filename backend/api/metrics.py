@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hmac import compare_digest
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: секунды и количество запросов к базе.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Сколько последних измерений хранится для каждого действия.
+WINDOW_SIZE = 1000
+
+
+class QueryBudgetExceededError(Exception):
+    """Действие выполнило больше запросов к базе, чем разрешено."""
+
+
+class RequestMetrics:
+    """Счётчики одного запроса."""
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.timings = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка connection.execute_wrapper: число и время запросов.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.timings['db'] += time.perf_counter() - start
+
+    @contextmanager
+    def timing(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def server_timing(self):
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            + (f';desc="{self.queries} queries"' if name == 'db' else '')
+            for name, duration in self.timings.items())
+
+
+class MetricsRegistry:
+    """Скользящее окно измерений по действиям API."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+
+    def record(self, metrics):
+        with self.lock:
+            self.samples[metrics.endpoint].append(
+                (metrics.timings['total'], metrics.queries))
+
+    def histogram(self, name, endpoint, values, buckets):
+        lines = []
+        for bucket in buckets:
+            count = sum(1 for value in values if value <= bucket)
+            lines.append(
+                f'{name}_bucket{{endpoint="{endpoint}",le="{bucket}"}} '
+                f'{count}')
+        lines.append(
+            f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} '
+            f'{len(values)}')
+        lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {sum(values)}')
+        lines.append(f'{name}_count{{endpoint="{endpoint}"}} {len(values)}')
+        return lines
+
+    def export(self):
+        """Гистограммы в текстовом формате Prometheus."""
+        with self.lock:
+            samples = {
+                endpoint: list(values)
+                for endpoint, values in self.samples.items()
+            }
+        durations = [
+            '# TYPE foodgram_request_duration_seconds histogram']
+        queries = ['# TYPE foodgram_request_queries histogram']
+        for endpoint, values in sorted(samples.items()):
+            durations += self.histogram(
+                'foodgram_request_duration_seconds', endpoint,
+                [duration for duration, _ in values], DURATION_BUCKETS)
+            queries += self.histogram(
+                'foodgram_request_queries', endpoint,
+                [count for _, count in values], QUERY_BUCKETS)
+        return '\n'.join(durations + queries) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def check_budget(metrics):
+    budget = settings.QUERY_BUDGETS.get(metrics.endpoint)
+    if budget is None or metrics.queries <= budget:
+        return
+    message = '{0}: {1} запросов к базе при бюджете {2}.'.format(
+        metrics.endpoint, metrics.queries, budget)
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceededError(message)
+    logger.warning(message)
+
+
+# Счётчики текущего запроса. Контекст копируется в потоки
+# sync_to_async, поэтому запросы к базе из пула потоков под ASGI
+# учитываются в своём запросе.
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def finish_request(metrics, response):
+    response['Server-Timing'] = metrics.server_timing()
+    if metrics.endpoint is not None:
+        registry.record(metrics)
+        check_budget(metrics)
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Число и время запросов к базе, время ответа и Server-Timing.
+
+    Имя действия задаёт InstrumentedViewMixin, запросы к остальным
+    адресам не попадают в гистограммы. Работает и под WSGI, и под ASGI,
+    не переводя асинхронные представления в синхронный режим.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = request.metrics = RequestMetrics()
+            token = current_metrics.set(metrics)
+            try:
+                with metrics.timing('total'):
+                    response = await get_response(request)
+            finally:
+                current_metrics.reset(token)
+            return finish_request(metrics, response)
+    else:
+        def middleware(request):
+            metrics = request.metrics = RequestMetrics()
+            token = current_metrics.set(metrics)
+            try:
+                with metrics.timing('total'):
+                    response = get_response(request)
+            finally:
+                current_metrics.reset(token)
+            return finish_request(metrics, response)
+    return middleware
+
+
+class InstrumentedViewMixin:
+    """Имя действия и время сериализации для metrics_middleware."""
+
+    def initial(self, request, *args, **kwargs):
+        metrics = self.get_metrics()
+        if metrics is not None:
+            metrics.endpoint = f'{self.basename}.{self.action}'
+        super().initial(request, *args, **kwargs)
+
+    def get_metrics(self):
+        return getattr(self.request, 'metrics', None)
+
+    @contextmanager
+    def timing(self, name):
+        metrics = self.get_metrics()
+        if metrics is None:
+            yield
+            return
+        with metrics.timing(name):
+            yield
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            with self.timing('serializer'):
+                return to_representation(instance)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+def can_read_metrics(request):
+    """Администратор с сессией или Authorization: Bearer METRICS_TOKEN."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(settings.METRICS_TOKEN) and compare_digest(
+        authorization, f'Bearer {settings.METRICS_TOKEN}')
+
+
+def metrics_view(request):
+    """Гистограммы действий API для Prometheus."""
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.export(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,4 +1,9 @@
-from rest_framework.pagination import PageNumberPagination
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class CustomPagination(PageNumberPagination):
@@ -6,3 +11,92 @@ class CustomPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, хранящий количество объектов в кэше."""
+
+    def __init__(self, *args, cache_key, timeout, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+        self.timeout = timeout
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(self.cache_key, count, self.timeout)
+        return count
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов по (pub_date, id)."""
+
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = ('-pub_date', '-id')
+    # Порядок для ?ordering=popular из RecipeFilter, по индексу
+    # recipe_popular_idx.
+    popular_ordering = ('-favorites_count', '-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if (self.popular_ordering
+                and request.query_params.get('ordering') == 'popular'):
+            return self.popular_ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class UserCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация пользователей и подписок."""
+
+    ordering = ('id',)
+    popular_ordering = None
+
+
+class CursorOrPagePagination(CustomPagination):
+    """Постраничная пагинация или курсорная с ?pagination=cursor.
+
+    Курсорная пагинация не выполняет OFFSET и COUNT(*), поэтому
+    глубокие страницы отдаются так же быстро, как первая.
+    """
+
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_query_param = 'cursor'
+    # Время кэширования количества для списка без фильтров, 0 - без кэша.
+    count_cache_timeout = 0
+
+    def use_cursor(self, request):
+        return (self.cursor_query_param in request.query_params
+                or request.query_params.get('pagination') == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = None
+        if self.use_cursor(request):
+            self.cursor = self.cursor_pagination_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        unfiltered = set(request.query_params) <= {
+            self.page_query_param, self.page_size_query_param}
+        if self.count_cache_timeout and unfiltered:
+            self.django_paginator_class = partial(
+                CachedCountPaginator,
+                cache_key=f'page_count:{request.path}',
+                timeout=self.count_cache_timeout)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CursorOrPagePagination):
+    """Пагинация ленты рецептов."""
+
+    count_cache_timeout = 60
+
+
+class UserPagination(CursorOrPagePagination):
+    """Пагинация пользователей и подписок."""
+
+    cursor_pagination_class = UserCursorPagination
@@ -0,0 +1,43 @@
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, GroceryList
+from users.models import Subscribe
+
+
+class UserRelations:
+    """Избранное, покупки и подписки пользователя на время запроса.
+
+    Каждое множество загружается одним запросом при первом обращении,
+    дальше проверка принадлежности выполняется без обращения к базе.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def load(self, model, owner_field, field):
+        if self.user is None or self.user.is_anonymous:
+            return frozenset()
+        return frozenset(model.objects.filter(
+            **{owner_field: self.user},
+        ).values_list(field, flat=True))
+
+    @cached_property
+    def favorites(self):
+        return self.load(Favorite, 'user', 'recipe_id')
+
+    @cached_property
+    def shopping_cart(self):
+        return self.load(GroceryList, 'user', 'recipe_id')
+
+    @cached_property
+    def subscriptions(self):
+        return self.load(Subscribe, 'subscriber', 'author_id')
+
+
+def get_user_relations(request):
+    """Общий для фильтров и сериализаторов объект связей запроса."""
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request._user_relations = relations
+    return relations
@@ -0,0 +1,35 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# Даты и остальные типы, которые orjson записывает иначе, чем
+# JSONRenderer, передаются в кодировщик DRF.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом побайтно.
+
+    Запросы с отступом (Accept: application/json; indent=4), настройки
+    UNICODE_JSON и COMPACT_JSON не по умолчанию и данные, которые orjson
+    не кодирует, отрисовывает JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context)):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        # JSONRenderer экранирует разделители строк для JavaScript.
+        return content.replace(
+            b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_KEY = 'replica_pin:{0}'
+# Модели, которые всегда читаются из основной базы: токен должен
+# находиться сразу после входа, даже если реплика отстаёт.
+PRIMARY_MODELS = {'authtoken.token'}
+
+# Можно ли текущему запросу читать из реплики. Контекст копируется
+# в потоки sync_to_async, поэтому значение видно и под ASGI.
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def pin_key(request):
+    """Ключ клиента по заголовку авторизации.
+
+    Анонимные клиенты не закрепляются: за прокси у них общий адрес.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PIN_KEY.format(hashlib.md5(authorization.encode()).hexdigest())
+
+
+def start_request(request):
+    key = pin_key(request)
+    return read_from_replica.set(
+        request.method in SAFE_METHODS
+        and not (key and cache.get(key)))
+
+
+def finish_request(request, response):
+    key = pin_key(request)
+    if (key and request.method not in SAFE_METHODS
+            and response.status_code < 400):
+        # Следующие запросы клиента читают свои изменения из основной
+        # базы, пока реплика их не получила.
+        cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """Выбор базы для чтения в запросе.
+
+    Безопасные запросы читают из реплики, кроме клиентов, которые
+    недавно успешно что-то изменили: они закрепляются за основной базой
+    на REPLICA_PIN_SECONDS.
+    """
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        raise MiddlewareNotUsed
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = start_request(request)
+            try:
+                response = await get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            return finish_request(request, response)
+    else:
+        def middleware(request):
+            token = start_request(request)
+            try:
+                response = get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            return finish_request(request, response)
+    return middleware
+
+
+class ReplicaRouter:
+    """Чтение из реплики, запись и транзакции в основной базе."""
+
+    def db_for_read(self, model, **hints):
+        if (read_from_replica.get()
+                and model._meta.label_lower not in PRIMARY_MODELS
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
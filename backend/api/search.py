@@ -0,0 +1,74 @@
+import threading
+from bisect import bisect_left
+
+from api.cache import get_version
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Строится при первом поиске и перестраивается после изменения
+    справочника (версия из api.cache). Сначала возвращаются совпадения
+    с начала названия, затем совпадения внутри названия.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.entries = ([], [])
+
+    def build(self, version):
+        ingredients = sorted(
+            (name.lower(), ingredient_id, name, measurement_unit)
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'))
+        # Ключи и данные заменяются одним присваиванием.
+        self.entries = (
+            [ingredient[0] for ingredient in ingredients],
+            [
+                {
+                    'id': ingredient_id,
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                }
+                for _, ingredient_id, name, measurement_unit in ingredients
+            ],
+        )
+        self.version = version
+
+    def is_current(self):
+        return self.version == get_version('ingredients')
+
+    def refresh(self):
+        version = get_version('ingredients')
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.build(version)
+
+    def search(self, query, limit=None):
+        self.refresh()
+        return self.find(query, limit)
+
+    def find(self, query, limit=None):
+        """Поиск без проверки версии, не обращается к базе."""
+        keys, items = self.entries
+        query = query.lower()
+        result = []
+        index = bisect_left(keys, query)
+        while (index < len(keys) and keys[index].startswith(query)
+               and (limit is None or len(result) < limit)):
+            result.append(items[index])
+            index += 1
+        if query:
+            for key, item in zip(keys, items):
+                if limit is not None and len(result) >= limit:
+                    break
+                if key.find(query) > 0:
+                    result.append(item)
+        return result
+
+
+ingredient_index = IngredientIndex()
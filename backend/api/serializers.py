@@ -1,15 +1,19 @@
 import base64
+import binascii
+from collections import Counter
 
 from django.db import transaction
 from django.core.files.base import ContentFile
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
-from foodgram.settings import DEFAULT_RECIPE_LIMIT
-from recipes.models import (Favorite, GroceryList, Ingredient, Recipe,
-                            RecipeIngredients, Tag)
-from users.models import Subscribe, User
+from foodgram.settings import (BULK_MAX_IDS, DEFAULT_RECIPE_LIMIT,
+                               IMAGE_MAX_SIZE)
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from users.models import User
+
+from api.relations import get_user_relations
+from api.utils import change_counter
 
 
 class Base64ImageField(serializers.ImageField):
@@ -17,12 +21,51 @@ class Base64ImageField(serializers.ImageField):
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            # Размер проверяется до декодирования всей строки.
+            if len(imgstr) * 3 // 4 > IMAGE_MAX_SIZE:
+                raise serializers.ValidationError(
+                    'Размер изображения больше {0} байт.'.format(
+                        IMAGE_MAX_SIZE))
+            try:
+                content = base64.b64decode(imgstr, validate=True)
+            except binascii.Error:
+                raise serializers.ValidationError(
+                    'Некорректные данные base64.')
+            # Имя по хэшу содержимого назначает хранилище.
+            data = ContentFile(content, name='image.' + ext)
         return super().to_internal_value(data)
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Адреса миниатюры и WebP-версии изображения рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        urls = value.storage.variant_urls(value.name)
+        request = self.context.get('request')
+        if request is not None:
+            urls = {
+                variant: url and request.build_absolute_uri(url)
+                for variant, url in urls.items()
+            }
+        return urls
+
+
+def get_relations(context):
+    """Связи пользователя из контекста или из запроса."""
+    relations = context.get('relations')
+    if relations is None and context.get('request') is not None:
+        return get_user_relations(context['request'])
+    return relations
+
+
 class CustomUserSerializer(UserSerializer):
     """Работа с пользователем."""
 
@@ -33,10 +76,8 @@ class CustomUserSerializer(UserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user is None or user.is_anonymous:
-            return False
-        return obj.author.filter(subscriber=user, author=obj).exists()
+        relations = get_relations(self.context)
+        return relations is not None and obj.id in relations.subscriptions
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -103,24 +144,21 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image',
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
                   'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user is None or user.is_anonymous:
-            return False
-        return obj.favorite.filter(user=user, recipe=obj).exists()
+        relations = get_relations(self.context)
+        return relations is not None and obj.id in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user is None or user.is_anonymous:
-            return False
-        return obj.in_grocery_list.filter(user=user, recipe=obj).exists()
+        relations = get_relations(self.context)
+        return relations is not None and obj.id in relations.shopping_cart
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -145,15 +183,37 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             context={'request': self.context.get('request')})
         return serializer.data
 
+    def validate_ingredients(self, value):
+        """Проверка ингредиентов рецепта одним запросом к базе."""
+        if not value:
+            raise serializers.ValidationError('Нужен хотя бы один ингредиент.')
+        ids = [ingredient['id'] for ingredient in value]
+        duplicates = sorted(
+            ingredient_id for ingredient_id, count in Counter(ids).items()
+            if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(
+                'Повторяющиеся ингредиенты: {0}.'.format(
+                    ', '.join(map(str, duplicates))))
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [
+            ingredient_id for ingredient_id in ids
+            if ingredient_id not in found]
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {0}.'.format(
+                    ', '.join(map(str, missing))))
+        for ingredient in value:
+            ingredient['ingredient'] = found[ingredient['id']]
+        return value
+
     def add_ingredient(self, ingredients, recipe):
         """Добавление ингридиета при создании и изменении рецепта."""
         RecipeIngredients.objects.bulk_create([
             RecipeIngredients(
                 recipe=recipe,
                 amount=ingredient['amount'],
-                ingredient=get_object_or_404(
-                    Ingredient,
-                    id=ingredient['id']),
+                ingredient=ingredient['ingredient'],
             ) for ingredient in ingredients])
 
     @transaction.atomic
@@ -162,118 +222,154 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         user = self.context.get('request').user
         recipe = Recipe.objects.create(author=user, **validated_data)
+        change_counter(User, user.id, 'recipes_count', 1)
         recipe.tags.set(tags)
         self.add_ingredient(ingredients, recipe)
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """Изменение только добавленных, удалённых и изменённых строк."""
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredients.objects.filter(
+                recipe=recipe)
+        }
+        new = {ingredient['id']: ingredient for ingredient in ingredients}
+        removed = current.keys() - new.keys()
+        if removed:
+            RecipeIngredients.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = new.get(ingredient_id, {}).get('amount')
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        self.add_ingredient(
+            [
+                ingredient for ingredient_id, ingredient in new.items()
+                if ingredient_id not in current
+            ],
+            recipe)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.add_ingredient(ingredients, instance)
-        instance.save()
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            # set() сам вычисляет добавленные и удалённые теги.
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(ingredients, instance)
         return super().update(instance, validated_data)
 
 
 class RecipeDataSerializer(serializers.ModelSerializer):
     """Сериализатор коротких данных рецепта."""
 
-    class Meta:
-        model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-
-
-class GrocerySerializer(serializers.ModelSerializer):
-    """Работа со списком покупок."""
-
-    user = serializers.IntegerField(source='user.id', write_only=True)
-    recipe = serializers.IntegerField(source='recipe.id', write_only=True)
-
-    class Meta:
-        model = GroceryList
-        fields = ('id', 'user', 'recipe')
-
-    def validate(self, data):
-        user = data['user']['id']
-        recipe = data['recipe']['id']
-        if GroceryList.objects.filter(user__id=user,
-                                      recipe__id=recipe).exists():
-            raise serializers.ValidationError({'errors': 'Уже в списке.'})
-        return data
-
-    def to_representation(self, instance):
-        serializer = RecipeDataSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')})
-        return serializer.data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Добавление и удаление рецепта из избранного."""
-
-    user = serializers.IntegerField(source='user.id', write_only=True)
-    recipe = serializers.IntegerField(source='recipe.id', write_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
-        model = Favorite
-        fields = ('id', 'user', 'recipe')
-
-    def validate(self, data):
-        user = data['user']['id']
-        recipe = data['recipe']['id']
-        if Favorite.objects.filter(user__id=user, recipe__id=recipe).exists():
-            raise serializers.ValidationError({'errors': 'Уже в избранном.'})
-        return data
-
-    def create(self, validated_data):
-        user = validated_data['user']
-        recipe = validated_data['recipe']
-        Favorite.objects.get_or_create(user=user, recipe=recipe)
-        return validated_data
-
-    def to_representation(self, instance):
-        serializer = RecipeDataSerializer(
-            instance['recipe'],
-            context={'request': self.context.get('request')})
-        return serializer.data
-
-
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериализатор подписки и отписки."""
-
-    subscriber = serializers.IntegerField(
-        source='subscriber.id',
-        write_only=True)
-    author = serializers.IntegerField(
-        source='author.id',
-        write_only=True)
-
-    class Meta:
-        model = Subscribe
-        fields = ('id', 'subscriber', 'author')
-
-    def validate(self, data):
-        subscriber = data['subscriber']['id']
-        author = data['author']['id']
-        if Subscribe.objects.filter(
-            subscriber__id=subscriber,
-            author__id=author,
-        ).exists():
-            raise serializers.ValidationError(
-                {'errors': 'Вы уже подписаны на этого автора.'})
-        if subscriber == author:
-            raise serializers.ValidationError(
-                {'errors': 'Нельзя подписаться на себя.'})
-        return data
-
-    def create(self, validated_data):
-        subscriber = validated_data['subscriber']
-        author = validated_data['author']
-        Subscribe.objects.get_or_create(subscriber=subscriber, author=author)
-        return validated_data
+        model = Recipe
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+def image_url(image):
+    return image.url if image else None
+
+
+def image_variants(image):
+    return image.storage.variant_urls(image.name) if image else None
+
+
+def tag_data(tag):
+    return {
+        'id': tag.id,
+        'name': tag.name,
+        'color': tag.color,
+        'slug': tag.slug,
+    }
+
+
+def author_data(user):
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': False,
+    }
+
+
+def recipe_data(recipe):
+    """Рецепт в формате RecipeSerializer без запроса, без сериализаторов.
+
+    Теги и ингредиенты берутся из prefetch_related, адреса
+    относительные, флаги пользователя добавляет api.cache.personalize.
+    """
+    return {
+        'id': recipe.id,
+        'tags': [tag_data(tag) for tag in recipe.tags.all()],
+        'author': author_data(recipe.author),
+        'ingredients': [
+            {
+                'id': item.ingredient_id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredients_in.all()
+        ],
+        'is_favorited': False,
+        'is_in_shopping_cart': False,
+        'name': recipe.name,
+        'image': image_url(recipe.image),
+        'image_variants': image_variants(recipe.image),
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def short_recipe_data(recipe):
+    """Рецепт в формате RecipeDataSerializer без запроса."""
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': image_url(recipe.image),
+        'image_variants': image_variants(recipe.image),
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS)
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+def get_recipes_limit(request):
+    """Количество рецептов автора из параметра recipes_limit."""
+    recipes_limit = request.query_params.get(
+        'recipes_limit',
+        DEFAULT_RECIPE_LIMIT)
+    try:
+        recipes_limit = int(recipes_limit)
+    except (TypeError, ValueError):
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Должно быть неотрицательным целым числом.'})
+    return recipes_limit
 
 
 class SubscribeResponseSerializer(serializers.ModelSerializer):
@@ -290,14 +386,14 @@ class SubscribeResponseSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         """Отображение рецептов автора в подписках."""
-        queryset = self.context.get('request')
-        recipes_limit = queryset.query_params.get(
-            'recipes_limit',
-            DEFAULT_RECIPE_LIMIT)
-        return RecipeDataSerializer(
-            obj.recipes.all()[:int(recipes_limit)],
-            many=True).data
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is not None:
+            recipes = author_recipes.get(obj.id, [])
+        else:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()[:recipes_limit]
+        return [short_recipe_data(recipe) for recipe in recipes]
 
     def get_recipes_count(self, obj):
         """Счётчик рецептов."""
-        return obj.recipes.filter(author=obj).count()
+        return obj.recipes_count
@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import forget_token, forget_user_tokens
+from api.cache import bump_version, invalidate_recipes
+from recipes.images import variants_created
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from users.models import User
+
+# Поля пользователя, которые не входят в представление рецепта.
+USER_PRIVATE_FIELDS = {'last_login', 'password'}
+
+
+def on_commit_invalidate(recipe_ids):
+    # После коммита, чтобы параллельный запрос не закэшировал старые данные.
+    transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+
+
+def on_commit_bump(name):
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    on_commit_bump('tags')
+    on_commit_bump('recipes')
+    on_commit_bump('feed')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    on_commit_bump('ingredients')
+    on_commit_bump('recipes')
+    on_commit_bump('feed')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    on_commit_invalidate([instance.id])
+
+
+@receiver(variants_created)
+def image_variants_created(sender, name, **kwargs):
+    # Варианты появляются после сохранения рецепта, а их адреса хранятся
+    # в закэшированном представлении.
+    recipe_ids = list(
+        Recipe.objects.filter(image=name).values_list('id', flat=True))
+    if recipe_ids:
+        invalidate_recipes(recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    on_commit_invalidate([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        on_commit_invalidate([instance.id])
+    elif pk_set:
+        on_commit_invalidate(list(pk_set))
+    else:
+        on_commit_bump('recipes')
+        on_commit_bump('feed')
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or (
+            update_fields and set(update_fields) <= USER_PRIVATE_FIELDS):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        on_commit_invalidate(recipe_ids)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # Выход через auth/token/logout и удаление пользователя. Ключ
+    # запоминается сразу: после удаления первичный ключ обнуляется.
+    key = instance.key
+    transaction.on_commit(lambda: forget_token(key))
+
+
+@receiver(post_save, sender=User)
+def user_credentials_changed(sender, instance, created, **kwargs):
+    # Смена пароля, деактивация и любые изменения пользователя
+    # из кэша токенов.
+    if not created:
+        transaction.on_commit(lambda: forget_user_tokens(instance.id))
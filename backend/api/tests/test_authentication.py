@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from users.models import User
+
+from api.authentication import forget_token, token_cache, token_cache_key
+
+ME_URL = '/api/users/me/'
+PASSWORD = 'Pass-12345-word'
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    """Кэш токенов и его сброс при выходе, смене пароля и деактивации."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@ya.ru', password=PASSWORD,
+            first_name='Имя', last_name='Фамилия')
+        self.token = Token.objects.create(user=self.user)
+        self.addCleanup(forget_token, self.token.key)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        return self.client.get(ME_URL).status_code
+
+    def is_cached(self):
+        return token_cache.get(token_cache_key(self.token.key)) is not None
+
+    def test_cached_token_skips_lookup(self):
+        self.assertEqual(self.get_me(), 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_me(), 200)
+        self.assertNotIn(
+            'authtoken_token', ' '.join(q['sql'] for q in queries))
+
+    def test_logout(self):
+        self.assertEqual(self.get_me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.get_me(), 401)
+
+    def test_set_password(self):
+        self.assertEqual(self.get_me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': PASSWORD,
+                'new_password': 'Other-12345-word',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.is_cached())
+
+    def test_deactivation(self):
+        self.assertEqual(self.get_me(), 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_write_uses_fresh_user(self):
+        # Изменение из другого процесса не сбрасывает кэш этого процесса,
+        # но запись не должна вернуть старые значения из кэша.
+        self.assertEqual(self.get_me(), 200)
+        User.objects.filter(id=self.user.id).update(first_name='Новое')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': PASSWORD,
+            'new_password': 'Other-12345-word',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Новое')
+        self.assertTrue(self.user.check_password('Other-12345-word'))
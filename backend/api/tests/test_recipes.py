@@ -0,0 +1,128 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from users.models import User
+
+from api.authentication import forget_token
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    url = '/api/recipes/?limit=50'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@ya.ru', password='password')
+        cls.tags = [
+            Tag.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (('a', '#111111'), ('b', '#222222'))]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{index}', measurement_unit='g')
+            for index in range(3)]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        start = Recipe.objects.count()
+        for index in range(start, start + count):
+            author = User.objects.create(
+                username=f'author{index}', email=f'author{index}@ya.ru')
+            recipe = Recipe.objects.create(
+                name=f'recipe{index}', author=author, text='text',
+                image='recipes/images/image.png')
+            recipe.tags.set(self.tags)
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(recipe=recipe, ingredient=ingredient)
+                for ingredient in self.ingredients)
+
+    def get_list(self, url=None, cold=True):
+        if cold:
+            # Пустой кэш: связи всех рецептов страницы загружаются из базы.
+            cache.clear()
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_queries_constant(self, url=None, cold=True):
+        """Страница из 2 и из 50 рецептов за одно число запросов."""
+        self.create_recipes(2)
+        self.get_list(url)
+        with CaptureQueriesContext(connection) as small_page:
+            self.assertEqual(
+                len(self.get_list(url, cold).data['results']), 2)
+        # Запрос к серверу очищает connection.queries.
+        queries = len(small_page)
+        self.create_recipes(48)
+        self.get_list(url)
+        with self.assertNumQueries(queries):
+            self.assertEqual(
+                len(self.get_list(url, cold).data['results']), 50)
+
+    def test_list_queries_constant(self):
+        self.assert_queries_constant()
+
+    def test_cached_list_queries_constant(self):
+        self.assert_queries_constant(cold=False)
+
+    def test_token_list_queries_constant(self):
+        # Настоящий токен: бюджет учитывает и запрос аутентификации.
+        token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.addCleanup(forget_token, token.key)
+        url = f'{self.url}&tags=a&tags=b'
+        self.create_recipes(2)
+        forget_token(token.key)
+        with CaptureQueriesContext(connection) as small_page:
+            self.get_list(url)
+        queries = len(small_page)
+        self.create_recipes(48)
+        forget_token(token.key)
+        with self.assertNumQueries(queries):
+            self.assertEqual(len(self.get_list(url).data['results']), 50)
+
+
+class RecipeOrderingTest(APITestCase):
+    """Порядок ?ordering=popular в постраничном и курсорном режимах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        for name in ('old', 'new'):
+            Recipe.objects.create(
+                name=name, author=author, text='text',
+                image='recipes/images/image.png')
+        Recipe.objects.filter(name='old').update(favorites_count=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_names(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [recipe['name'] for recipe in response.data['results']]
+            url = response.data['next']
+        return names
+
+    def test_popular_page(self):
+        self.assertEqual(
+            self.get_names('/api/recipes/?ordering=popular&limit=1'),
+            ['old', 'new'])
+
+    def test_popular_cursor(self):
+        self.assertEqual(
+            self.get_names(
+                '/api/recipes/?ordering=popular&pagination=cursor&limit=1'),
+            ['old', 'new'])
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.async_views import async_routes
+from api.metrics import metrics_view
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
 
 
@@ -10,8 +13,13 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('tags', TagViewSet, basename='tags')
 
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    # Под ASGI рецепты, теги и ингредиенты читаются асинхронно.
+    router_urls = async_routes(router_urls)
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('users.urls')),
-    path('', include(router.urls)),
+    path('', include(router_urls)),
 ]
@@ -1,34 +1,233 @@
-from django.http import HttpResponse
-
-from recipes.models import GroceryList, RecipeIngredients
-
-
-def download_shopping_cart(request):
-    """Возвращает текстовый фаил со списком ингредиентов из списка покупок."""
-    grocery_list = GroceryList.objects.filter(user=request.user)
-    shopping_list = dict()
-    for purchase in grocery_list:
-        ingredients = RecipeIngredients.objects.filter(
-            recipe=purchase.recipe.id)
-        for ing in ingredients:
-            name = ing.ingredient.name
-            measuring_unit = ing.ingredient.measurement_unit
-            amount = ing.amount
-            if name not in shopping_list:
-                shopping_list[name] = {
-                    'name': name,
-                    'measurement_unit': measuring_unit,
-                    'amount': amount}
-            else:
-                shopping_list[name]['amount'] += amount
-
-    content = (
-        [
-            f'{item["name"]} ({item["measurement_unit"]}) - {item["amount"]}\n'
-            for item in shopping_list.values()
-        ])
-    filename = 'shopping_list.txt'
-    text_file = HttpResponse(content, content_type='text/plain')
-    text_file['Content-Disposition'] = (
+import csv
+import json
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import BaseContentNegotiation
+
+from foodgram.settings import SHOPPING_LIST_CHUNK_SIZE
+from recipes.models import Recipe, RecipeIngredients
+
+
+class ShoppingListNegotiation(BaseContentNegotiation):
+    """Параметр format выбирает формат файла, а не рендерер DRF."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class Echo:
+    """Буфер, возвращающий записанную строку, для потокового csv."""
+
+    def write(self, value):
+        return value
+
+
+def stream_txt(items):
+    for item in items:
+        yield (f'{item["name"]} ({item["measurement_unit"]}) - '
+               f'{item["amount"]}\n')
+
+
+def stream_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow(
+            (item['name'], item['measurement_unit'], item['amount']))
+
+
+def stream_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'json': (stream_json, 'application/json'),
+}
+
+
+def get_shopping_list(user):
+    """Суммарное количество ингредиентов из списка покупок пользователя."""
+    return RecipeIngredients.objects.filter(
+        recipe__in_grocery_list__user=user,
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        amount=Sum('amount'),
+    ).order_by('ingredient__name')
+
+
+def download_shopping_cart(request, file_format='txt'):
+    """Возвращает фаил со списком ингредиентов из списка покупок."""
+    stream, content_type = SHOPPING_LIST_FORMATS[file_format]
+    items = (
+        {
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount'],
+        }
+        for item in get_shopping_list(request.user).iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+    )
+    filename = f'shopping_list.{file_format}'
+    response = StreamingHttpResponse(
+        stream(items),
+        content_type=content_type)
+    response['Content-Disposition'] = (
         'attachment; filename={0}'.format(filename))
-    return text_file
+    return response
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение денормализованного счётчика через F()."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def relation_sql(model, owner_field, target_field, template):
+    """Запрос к таблице связей с подставленными именами таблиц и колонок."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field)
+    target_meta = target.related_model._meta
+    sql = template.format(
+        table=quote(model._meta.db_table),
+        owner=quote(model._meta.get_field(owner_field).column),
+        target=quote(target.column),
+        pk=quote(target_meta.pk.column),
+        target_table=quote(target_meta.db_table))
+    return connection, sql
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def insert_relation(model, owner_field, owner_id, target_field, target_id):
+    """Вставка связи одним INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+
+    Строка добавляется, только если целевой объект существует и такой
+    связи ещё нет. Возвращает количество вставленных строк.
+    """
+    connection, sql = relation_sql(
+        model, owner_field, target_field,
+        'INSERT INTO {table} ({owner}, {target}) '
+        'SELECT %s, {pk} FROM {target_table} WHERE {pk} = %s '
+        'ON CONFLICT DO NOTHING')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (owner_id, target_id))
+        return cursor.rowcount
+
+
+def bulk_add_relations(model, owner_field, owner, target_field, target_ids,
+                       counter):
+    """Добавление связей пачкой: статус added, exists или not_found по id.
+
+    Статусы и счётчики берутся из строк, которые вернул INSERT ...
+    RETURNING: связь, добавленная параллельным запросом, получает exists
+    и не увеличивает счётчик второй раз.
+    """
+    if not target_ids:
+        return {}
+    target_model = model._meta.get_field(target_field).related_model
+    connection, sql = relation_sql(
+        model, owner_field, target_field,
+        'INSERT INTO {table} ({owner}, {target}) '
+        'SELECT %s, {pk} FROM {target_table} '
+        'WHERE {pk} IN (' + placeholders(target_ids) + ') '
+        'ON CONFLICT DO NOTHING RETURNING {target}')
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (owner.pk, *target_ids))
+            added = {pk for pk, in cursor.fetchall()}
+        target_model.objects.filter(pk__in=added).update(
+            **{counter: F(counter) + 1})
+        found = set(target_model.objects.filter(
+            pk__in=target_ids).values_list('pk', flat=True))
+    return {
+        pk: 'added' if pk in added else
+        'exists' if pk in found else 'not_found'
+        for pk in target_ids
+    }
+
+
+def bulk_remove_relations(model, owner_field, owner, target_field,
+                          target_ids, counter):
+    """Удаление связей пачкой: статус removed или absent по id.
+
+    Счётчики уменьшаются только для строк, которые вернул DELETE ...
+    RETURNING, поэтому параллельное удаление не вычитает их дважды.
+    """
+    target_model = model._meta.get_field(target_field).related_model
+    connection, sql = relation_sql(
+        model, owner_field, target_field,
+        'DELETE FROM {table} WHERE {owner} = %s '
+        'AND {target} IN (' + placeholders(target_ids) + ') '
+        'RETURNING {target}')
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (owner.pk, *target_ids))
+            removed = {pk for pk, in cursor.fetchall()}
+        target_model.objects.filter(
+            pk__in=removed,
+            **{f'{counter}__gte': 1},
+        ).update(**{counter: F(counter) - 1})
+    return {
+        pk: 'removed' if pk in removed else 'absent'
+        for pk in target_ids
+    }
+
+
+def bulk_response(statuses, errors):
+    """Результат пакетной операции для каждого id."""
+    results = []
+    for pk, result in statuses.items():
+        if result in errors:
+            results.append({'id': pk, 'success': False,
+                            'errors': errors[result]})
+        else:
+            results.append({'id': pk, 'success': True})
+    return {'results': results}
+
+
+def get_author_recipes(author_ids, recipes_limit):
+    """Первые recipes_limit рецептов каждого автора одним запросом.
+
+    Django 3.2 не умеет фильтровать по оконной функции, поэтому запрос
+    с ROW_NUMBER() оборачивается в подзапрос.
+    """
+    author_recipes = defaultdict(list)
+    if not author_ids:
+        return author_recipes
+    ranked = Recipe.objects.filter(
+        author_id__in=author_ids,
+    ).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=(F('author_id'),),
+            order_by=(F('pub_date').desc(), F('id').desc())),
+    ).only('id', 'name', 'image', 'cooking_time', 'author_id')
+    sql, params = ranked.query.sql_with_params()
+    recipes = Recipe.objects.raw(
+        'SELECT * FROM ({0}) ranked WHERE row_number <= %s '
+        'ORDER BY row_number'.format(sql),
+        (*params, recipes_limit))
+    for recipe in recipes:
+        author_recipes[recipe.author_id].append(recipe)
+    return author_recipes
@@ -1,29 +1,44 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import Favorite, GroceryList, Ingredient, Recipe, Tag
+from recipes.models import (Favorite, GroceryList, Ingredient, Recipe,
+                            RecipeIngredients, Tag)
 from users.models import Subscribe, User
 
+from api.cache import (CachedDictionaryMixin, cached_feed_page,
+                       serialize_recipes)
 from api.filters import IngredientSearchFilter, RecipeFilter
+from api.metrics import InstrumentedViewMixin
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CustomUserCreateSerializer, CustomUserSerializer,
-                             FavoriteSerializer, GrocerySerializer,
-                             IngredientSerializer, RecipeCreateSerializer,
+from api.relations import get_user_relations
+from api.search import ingredient_index
+from api.serializers import (BulkIdsSerializer, CustomUserCreateSerializer,
+                             CustomUserSerializer, IngredientSerializer,
+                             RecipeCreateSerializer, RecipeDataSerializer,
                              RecipeSerializer, SubscribeResponseSerializer,
-                             SubscribeSerializer, TagSerializer)
-from api.utils import download_shopping_cart
-from api.pagination import CustomPagination
+                             TagSerializer, get_recipes_limit, recipe_data)
+from api.utils import (SHOPPING_LIST_FORMATS, ShoppingListNegotiation,
+                       bulk_add_relations, bulk_remove_relations,
+                       bulk_response, change_counter, download_shopping_cart,
+                       get_author_recipes, insert_relation)
+from api.pagination import RecipePagination, UserPagination
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedDictionaryMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Просмотр ингредиентов."""
 
+    cache_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -31,24 +46,85 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name',)
     lookup_field = 'id'
 
+    def get_list_response(self, request, version):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().get_list_response(request, version)
+        limit = request.query_params.get('limit')
+        if limit is not None and not limit.isdigit():
+            raise ValidationError({'limit': 'Должно быть целым числом.'})
+        return Response(ingredient_index.search(
+            name,
+            limit=int(limit) if limit is not None else None))
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CachedDictionaryMixin, viewsets.ReadOnlyModelViewSet):
     """Просмотр тегов."""
 
+    cache_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     lookup_field = 'id'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     """Работа с рецептами, списоком покупок и избранным."""
 
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    lookup_value_regex = r'\d+'
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_prefetch(self):
+        # Теги и ингредиенты загружаются фиксированным числом
+        # запросов независимо от размера страницы.
+        return (
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredients_in',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient')),
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('author')
+        if self.action in ('list', 'retrieve'):
+            # Список и рецепт загружают связи только для промахов кэша.
+            return queryset
+        return queryset.prefetch_related(*self.get_prefetch())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['relations'] = get_user_relations(self.request)
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_anonymous:
+            return cached_feed_page(request, self.get_page_response)
+        return self.get_page_response()
+
+    def get_page_response(self):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.serialize(page, many=True))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize(self.get_object(), many=False))
+
+    def serialize(self, recipes, many):
+        """Представление рецептов из кэша с флагами пользователя."""
+        recipes = list(recipes) if many else [recipes]
+        with self.timing('serializer'):
+            data = serialize_recipes(
+                recipes,
+                recipe_data,
+                self.get_prefetch(),
+                self.request,
+                get_user_relations(self.request))
+        return data if many else data[0]
+
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'partial_update':
             return RecipeCreateSerializer
@@ -64,63 +140,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsAuthorOrReadOnly]
         return [permission() for permission in self.permission_classes]
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+    def add_relation(self, model, pk, counter, error):
+        """Добавление рецепта в избранное или покупки одним INSERT."""
+        with transaction.atomic():
+            if not insert_relation(model, 'user', self.request.user.id,
+                                   'recipe', int(pk)):
+                get_object_or_404(Recipe, id=pk)
+                raise ValidationError({'errors': [error]})
+            change_counter(Recipe, pk, counter, 1)
+        serializer = RecipeDataSerializer(
+            Recipe.objects.get(id=pk),
+            context={'request': self.request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_relation(self, model, pk, counter):
+        """Удаление рецепта из избранного или покупок одним DELETE."""
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=self.request.user,
+                recipe_id=pk).delete()
+            if not deleted:
+                raise Http404
+            change_counter(Recipe, pk, counter, -1)
+
+    def bulk_relation(self, model, counter, errors):
+        """Пакетное добавление и удаление рецептов по списку id."""
+        serializer = BulkIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        handler = (bulk_add_relations if self.request.method == 'POST'
+                   else bulk_remove_relations)
+        statuses = handler(model, 'user', self.request.user, 'recipe',
+                           serializer.validated_data['ids'], counter)
+        return Response(bulk_response(statuses, errors))
+
     @action(detail=True,
             url_path='shopping_cart',
             methods=['post', 'delete'])
     def grocery_list(self, request, pk):
         """Добавление и удаление рецепта в список покупок."""
-        recipe = get_object_or_404(Recipe, id=pk)
-        serializer = GrocerySerializer(
-            data={'user': request.user.id, 'recipe': recipe.id})
         if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            grocery = get_object_or_404(
-                GroceryList,
-                user=request.user,
-                recipe__id=pk)
-            grocery.delete()
-            return Response('Удален из покупок',
-                            status=status.HTTP_204_NO_CONTENT)
+            return self.add_relation(
+                GroceryList, pk, 'carts_count', 'Уже в списке.')
+        self.remove_relation(GroceryList, pk, 'carts_count')
+        return Response('Удален из покупок',
+                        status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False,
+            url_path='shopping_cart/batch',
+            methods=['post', 'delete'])
+    def grocery_list_batch(self, request):
+        """Пакетное добавление и удаление рецептов в списке покупок."""
+        return self.bulk_relation(GroceryList, 'carts_count', {
+            'exists': 'Уже в списке.',
+            'not_found': 'Рецепт не найден.',
+            'absent': 'Рецепта нет в списке покупок.',
+        })
 
     @action(detail=False,
             url_path='download_shopping_cart',
-            methods=['get'])
+            methods=['get'],
+            content_negotiation_class=ShoppingListNegotiation)
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок."""
-        return download_shopping_cart(request)
+        """Скачивание списка покупок в формате txt, csv или json."""
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: {0}.'.format(
+                    ', '.join(SHOPPING_LIST_FORMATS))},
+                status=status.HTTP_400_BAD_REQUEST)
+        return download_shopping_cart(request, file_format)
 
     @action(detail=True,
             url_path='favorite',
             methods=['post', 'delete'])
     def favorite(self, request, pk):
         """Добавление и удаление рецепта из избранного."""
-        recipe = get_object_or_404(Recipe, id=pk)
-        serializer = FavoriteSerializer(
-            data={'user': request.user.id, 'recipe': recipe.id})
         if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            favorite = get_object_or_404(
-                Favorite,
-                user=request.user,
-                recipe__id=pk)
-            favorite.delete()
-            return Response('Удален из избранного',
-                            status=status.HTTP_204_NO_CONTENT)
+            return self.add_relation(
+                Favorite, pk, 'favorites_count', 'Уже в избранном.')
+        self.remove_relation(Favorite, pk, 'favorites_count')
+        return Response('Удален из избранного',
+                        status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False,
+            url_path='favorite/batch',
+            methods=['post', 'delete'])
+    def favorite_batch(self, request):
+        """Пакетное добавление и удаление рецептов в избранном."""
+        return self.bulk_relation(Favorite, 'favorites_count', {
+            'exists': 'Уже в избранном.',
+            'not_found': 'Рецепт не найден.',
+            'absent': 'Рецепта нет в избранном.',
+        })
 
-class CustomUserViewSet(UserViewSet):
+
+class CustomUserViewSet(InstrumentedViewMixin, UserViewSet):
     """Работа с пользователетями и подписками."""
 
     queryset = User.objects.all()
-    pagination_class = CustomPagination
+    lookup_value_regex = r'\d+'
+    pagination_class = UserPagination
     permission_classes = (permissions.AllowAny,)
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['relations'] = get_user_relations(self.request)
+        return context
+
     def get_serializer_class(self):
         if self.action == 'create':
             return CustomUserCreateSerializer
@@ -140,34 +271,77 @@ class CustomUserViewSet(UserViewSet):
             methods=['post', 'delete'])
     def subscribe(self, request, id=None):
         """Подписка и отписка от автора."""
-        author = get_object_or_404(User, id=id)
-        serializer = SubscribeSerializer(
-            data={'subscriber': request.user.id, 'author': author.id})
         if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, subscriber=request.user)
+            if request.user.id == int(id):
+                raise ValidationError(
+                    {'errors': ['Нельзя подписаться на себя.']})
+            with transaction.atomic():
+                if not insert_relation(Subscribe, 'subscriber',
+                                       request.user.id, 'author', int(id)):
+                    get_object_or_404(User, id=id)
+                    raise ValidationError(
+                        {'errors': ['Вы уже подписаны на этого автора.']})
+                change_counter(User, id, 'subscribers_count', 1)
             # Вызов сериализатора для кастомного ответа.
             serializer = SubscribeResponseSerializer(
-                author,
+                User.objects.get(id=id),
                 context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            subscribe = get_object_or_404(
-                Subscribe,
+        with transaction.atomic():
+            deleted, _ = Subscribe.objects.filter(
                 subscriber=request.user,
-                author__id=id)
-            subscribe.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+                author_id=id).delete()
+            if not deleted:
+                raise Http404
+            change_counter(User, id, 'subscribers_count', -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False,
+            url_path='subscribe/batch',
+            methods=['post', 'delete'])
+    def subscribe_batch(self, request):
+        """Пакетная подписка и отписка от авторов."""
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            statuses = bulk_add_relations(
+                Subscribe, 'subscriber', request.user, 'author',
+                [author_id for author_id in ids
+                 if author_id != request.user.id],
+                'subscribers_count')
+            if request.user.id in ids:
+                statuses[request.user.id] = 'self'
+        else:
+            statuses = bulk_remove_relations(
+                Subscribe, 'subscriber', request.user, 'author', ids,
+                'subscribers_count')
+        return Response(bulk_response(
+            {author_id: statuses[author_id] for author_id in ids},
+            {
+                'exists': 'Вы уже подписаны на этого автора.',
+                'not_found': 'Автор не найден.',
+                'self': 'Нельзя подписаться на себя.',
+                'absent': 'Вы не подписаны на этого автора.',
+            }))
 
     @action(detail=False,
             url_path='subscriptions',
             methods=['get'])
     def subscriptions(self, request):
         """Список пользователей, на которых подписан текущий пользователь."""
+        recipes_limit = get_recipes_limit(request)
         queryset = User.objects.filter(author__subscriber=request.user)
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeResponseSerializer(
             pages,
             many=True,
-            context={'request': request})
-        return self.get_paginated_response(serializer.data)
+            context={
+                'request': request,
+                'author_recipes': get_author_recipes(
+                    [author.id for author in pages],
+                    recipes_limit),
+            })
+        with self.timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
@@ -39,6 +39,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.metrics.metrics_middleware',
+    'api.replicas.replica_middleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -74,6 +76,36 @@ DATABASES = {
     },
 }
 
+# Необязательная реплика для чтения: безопасные запросы читают из неё,
+# запись, транзакции и клиенты, недавно менявшие данные, работают
+# с основной базой.
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv(
+            'DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+        'HOST': os.getenv(
+            'DB_REPLICA_HOST', default=DATABASES['default']['HOST']),
+        'PORT': os.getenv(
+            'DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Сколько секунд клиент читает из основной базы после изменения данных.
+REPLICA_PIN_SECONDS = 10
+
+# Кэш. По умолчанию в памяти процесса, для нескольких воркеров
+# задайте общий бэкенд, например django_redis.cache.RedisCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,13 +137,30 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+# Кэш токенов авторизации: число записей в памяти процесса, время жизни
+# записи в секундах и копия в общем кэше CACHES для нескольких воркеров.
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='') == '1'
+
 # Колличество рецептов на странице подписок пользователья, по умолчанию.
 DEFAULT_RECIPE_LIMIT = 6
 
+# Максимальное количество id в пакетных запросах.
+BULK_MAX_IDS = 500
+
+# Размер пачки строк при потоковой выгрузке списка покупок.
+SHOPPING_LIST_CHUNK_SIZE = 2000
+
 AUTH_USER_MODEL = 'users.User'
 
 
@@ -137,4 +186,32 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Допустимое число запросов к базе для действий API. При превышении
+# пишется предупреждение, а в строгом режиме (тесты) - исключение.
+QUERY_BUDGETS = {
+    'recipes.list': 9,
+    'recipes.retrieve': 8,
+    'recipes.favorite': 5,
+    'recipes.grocery_list': 5,
+    'recipes.download_shopping_cart': 3,
+    'users.list': 6,
+    'users.subscribe': 8,
+    'users.subscriptions': 6,
+}
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', default='') == '1'
+
+# Токен Prometheus для /api/metrics/, без него адрес доступен
+# только администраторам.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+# Асинхронное чтение рецептов, тегов и ингредиентов. Включается
+# в foodgram/asgi.py, под WSGI остаются синхронные представления.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='') == '1'
+
+# Изображения рецептов: предельный размер загрузки в байтах,
+# сторона миниатюры и число потоков для создания вариантов.
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_THUMBNAIL_SIZE = 480
+IMAGE_WORKERS = 2
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -11,14 +11,11 @@ class IngredientAmountInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorite_count')
+    list_display = ('name', 'author', 'favorites_count', 'carts_count')
     list_filter = ('author', 'name', 'tags')
     filter_horizontal = ('tags',)
     inlines = (IngredientAmountInline,)
 
-    def favorite_count(self, obj):
-        return obj.favorite.count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections
+from django.dispatch import Signal
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Варианты изображения готовы: отправляется из потока пула с name.
+variants_created = Signal()
+
+# Варианты изображения: суффикс имени и максимальный размер стороны.
+VARIANTS = {
+    'thumbnail': ('_thumb.webp', settings.IMAGE_THUMBNAIL_SIZE),
+    'webp': ('_full.webp', None),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='images')
+
+
+def variant_name(name, variant):
+    suffix, _ = VARIANTS[variant]
+    return os.path.splitext(name)[0] + suffix
+
+
+def make_variants(storage, name):
+    """Создание уменьшенной копии и WebP-версии изображения."""
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for variant, (_, size) in VARIANTS.items():
+        variant_image = image.copy()
+        if size:
+            variant_image.thumbnail((size, size))
+        buffer = BytesIO()
+        variant_image.save(buffer, 'WEBP', quality=80)
+        storage.save_as_is(
+            variant_name(name, variant),
+            ContentFile(buffer.getvalue()))
+    try:
+        variants_created.send(sender=storage.__class__, name=name)
+    finally:
+        # Получатели обращаются к базе из потока пула, соединение
+        # закрывается так же, как в конце запроса.
+        close_old_connections()
+
+
+def log_errors(future):
+    if future.exception() is not None:
+        logger.error('Варианты изображения не созданы: %s',
+                     future.exception())
+
+
+class ImageStorage(FileSystemStorage):
+    """Хранилище изображений с именами по хэшу содержимого.
+
+    Одинаковые файлы сохраняются один раз, а варианты изображения
+    создаются в фоновом потоке, не задерживая запрос.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        name = os.path.join(
+            os.path.dirname(name),
+            digest.hexdigest() + os.path.splitext(name)[1].lower())
+        if self.exists(name):
+            return name
+        name = super().save(name, content, max_length=max_length)
+        executor.submit(make_variants, self, name).add_done_callback(
+            log_errors)
+        return name
+
+    def save_as_is(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        return super().save(name, content)
+
+    def variant_urls(self, name):
+        """Адреса готовых вариантов, None пока вариант не создан."""
+        urls = {}
+        for variant in VARIANTS:
+            path = variant_name(name, variant)
+            urls[variant] = self.url(path) if self.exists(path) else None
+        return urls
+
+
+image_storage = ImageStorage()
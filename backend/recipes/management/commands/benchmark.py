@@ -0,0 +1,194 @@
+import json
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+# Название сценария, адрес и нужна ли авторизация.
+SCENARIOS = (
+    ('recipes_list_anonymous', '/api/recipes/', False),
+    ('recipes_list', '/api/recipes/', True),
+    ('recipes_list_50', '/api/recipes/?limit=50', True),
+    ('recipes_list_tags', '/api/recipes/?tags=breakfast&tags=lunch', True),
+    ('recipe_detail', '/api/recipes/{recipe_id}/', True),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/', True),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', True),
+    ('ingredients_search', '/api/ingredients/?name={ingredient}', False),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class QueryCounter:
+    """Обёртка connection.execute_wrapper, считающая запросы.
+
+    connection.queries не подходит: тестовый клиент очищает его
+    в начале каждого запроса.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def read_response(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class Command(BaseCommand):
+    """Замеры основных адресов API через тестовый клиент.
+
+    Данные для замеров создаёт команда seed. Результаты можно
+    сохранить и сравнивать с ними следующие запуски.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            default=None,
+            help='Названия сценариев.')
+        parser.add_argument('--save', help='Сохранить результаты в JSON.')
+        parser.add_argument('--baseline', help='JSON с прошлыми результатами.')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95, доля от базового значения.')
+
+    def get_user(self):
+        # Пользователь с наибольшим числом подписок и покупок.
+        user = User.objects.annotate(
+            weight=Count('subscriber', distinct=True)
+            + Count('in_grocery_list', distinct=True),
+        ).order_by('-weight', 'id').first()
+        if user is None:
+            raise CommandError('Нет данных, сначала запустите seed.')
+        return user
+
+    def get_scenarios(self, only):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or ingredient is None:
+            raise CommandError('Нет данных, сначала запустите seed.')
+        scenarios = [
+            (name, path.format(recipe_id=recipe.id,
+                               ingredient=ingredient.name[:2]), auth)
+            for name, path, auth in SCENARIOS
+        ]
+        if only:
+            unknown = set(only) - {name for name, _, _ in scenarios}
+            if unknown:
+                raise CommandError(
+                    'Неизвестные сценарии: {0}.'.format(
+                        ', '.join(sorted(unknown))))
+            scenarios = [
+                scenario for scenario in scenarios if scenario[0] in only]
+        return scenarios
+
+    def request(self, client, path, cold):
+        if cold:
+            cache.clear()
+        response = client.get(path)
+        read_response(response)
+        if response.status_code != 200:
+            raise CommandError('{0}: ответ {1}.'.format(
+                path, response.status_code))
+
+    def measure(self, client, path, repeat, cold):
+        # Прогрев, чтобы тёплые замеры не включали первый промах кэша.
+        self.request(client, path, cold)
+        durations = []
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            for _ in range(repeat):
+                start = time.perf_counter()
+                self.request(client, path, cold)
+                durations.append(time.perf_counter() - start)
+        # Память отдельным запросом: tracemalloc замедляет выполнение.
+        tracemalloc.start()
+        try:
+            self.request(client, path, cold)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(durations) * 1000, 2),
+            'p95_ms': round(percentile(durations, 95) * 1000, 2),
+            'queries': counter.count // repeat,
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append('{0}: p95 {1} мс, было {2} мс.'.format(
+                    name, result['p95_ms'], base['p95_ms']))
+            if result['queries'] > base['queries']:
+                regressions.append('{0}: {1} запросов, было {2}.'.format(
+                    name, result['queries'], base['queries']))
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        user = self.get_user()
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+            False: Client(),
+        }
+        results = {}
+        self.stdout.write('{0:<26}{1:>10}{2:>10}{3:>9}{4:>11}'.format(
+            'сценарий', 'p50, мс', 'p95, мс', 'запросы', 'память, КБ'))
+        for name, path, auth in self.get_scenarios(options['only']):
+            result = results[name] = self.measure(
+                clients[auth], path, options['repeat'], options['cold'])
+            self.stdout.write(
+                '{0:<26}{p50_ms:>10}{p95_ms:>10}{queries:>9}'
+                '{peak_kb:>11}'.format(name, **result))
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = self.compare(
+                results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Производительность ухудшилась:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(
+                'Результаты не хуже базовых.'))
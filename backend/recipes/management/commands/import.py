@@ -1,8 +1,13 @@
 import csv
+import json
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
 from recipes.models import Ingredient, Tag
 
 
@@ -11,24 +16,106 @@ TAGS = (
     ('Обед', '#49B64E', 'lunch'),
     ('Ужин', '#8775D2', 'dinner'))
 
+DEFAULT_BATCH_SIZE = 1000
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def unique(rows):
+    """Пропускает повторяющиеся в файле ингредиенты."""
+    seen = set()
+    for row in rows:
+        if row not in seen:
+            seen.add(row)
+            yield row
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
     """Импортирует ингредиенты и тэги."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Фаил с ингредиентами (.csv или .json).',
+            default=f'{settings.BASE_DIR}/data/ingredients.csv')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество ингредиентов в одном INSERT.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Прочитать фаил без записи в базу.')
+
     def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        reader = READERS.get(path.rsplit('.', 1)[-1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
         # Добавить ингредиенты.
-        with open(
-            f'{settings.BASE_DIR}/data/ingredients.csv',
-            'r',
-            encoding='utf-8',
-        ) as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
-            file.close()
+        start = time.monotonic()
+        before = Ingredient.objects.count()
+        rows = 0
+        with open(path, 'r', encoding='utf-8') as file:
+            with transaction.atomic():
+                for batch in batches(unique(reader(file)), batch_size):
+                    rows += len(batch)
+                    if dry_run:
+                        continue
+                    Ingredient.objects.bulk_create(
+                        [
+                            Ingredient(
+                                name=name,
+                                measurement_unit=measurement_unit)
+                            for name, measurement_unit in batch
+                        ],
+                        ignore_conflicts=True)
+        elapsed = time.monotonic() - start
+        created = Ingredient.objects.count() - before
+        if created:
+            # bulk_create не отправляет сигналы post_save. С кэшем
+            # в памяти процесса сервер увидит новые ингредиенты после
+            # истечения VERSION_TIMEOUT, с общим кэшем - сразу.
+            bump_version('ingredients')
+        self.stdout.write(
+            'Обработано {0} ингредиентов за {1:.2f} с ({2:.0f} строк/с), '
+            'добавлено {3}.'.format(
+                rows, elapsed, rows / elapsed if elapsed else rows, created))
+        if dry_run:
+            self.stdout.write('Пробный запуск, изменения не сохранены.')
+            return
+
         # Добавить теги.
         for tag in TAGS:
             name, color, slug = tag
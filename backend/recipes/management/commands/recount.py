@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, GroceryList, Recipe
+from users.models import Subscribe, User
+
+
+def count_of(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')},
+            ).order_by().values(field).annotate(
+                count=Count('pk'),
+            ).values('count'),
+            output_field=IntegerField()),
+        0)
+
+
+class Command(BaseCommand):
+    """Пересчитывает счётчики избранного, покупок, рецептов и подписчиков."""
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_of(Favorite, 'recipe'),
+            carts_count=count_of(GroceryList, 'recipe'))
+        users = User.objects.update(
+            recipes_count=count_of(Recipe, 'author'),
+            subscribers_count=count_of(Subscribe, 'author'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users}.'))
@@ -0,0 +1,152 @@
+import random
+import time
+import uuid
+from importlib import import_module
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand, call_command
+from django.db import transaction
+from PIL import Image
+
+from recipes.images import image_storage
+from recipes.models import (Favorite, GroceryList, Ingredient, Recipe,
+                            RecipeIngredients, Tag)
+from users.models import Subscribe, User
+
+BATCH_SIZE = 1000
+PASSWORD = 'benchmark-password'
+# Модуль команды import нельзя импортировать инструкцией import.
+TAGS = import_module('recipes.management.commands.import').TAGS
+
+
+def placeholder_image():
+    """Одно изображение на все рецепты, имя назначает хранилище."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (226, 108, 45)).save(buffer, 'PNG')
+    return image_storage.save(
+        'recipes/images/seed.png',
+        ContentFile(buffer.getvalue()))
+
+
+def random_pairs(rng, left, right, count):
+    """count различных случайных пар (left, right)."""
+    count = min(count, len(left) * len(right))
+    pairs = set()
+    while len(pairs) < count:
+        pairs.add((rng.choice(left), rng.choice(right)))
+    return pairs
+
+
+class Command(BaseCommand):
+    """Создаёт синтетические данные для нагрузочных тестов."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=2000)
+        parser.add_argument('--subscriptions', type=int, default=1000)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора для воспроизводимых данных.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = time.monotonic()
+        # Уникальный префикс: повторный запуск добавляет новых
+        # пользователей, не нарушая уникальность username.
+        prefix = f'seed{options["seed"]}_{uuid.uuid4().hex[:8]}'
+
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(name=name, color=color, slug=slug)
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['ingredients_per_recipe']:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=f'{prefix} ингредиент {number}',
+                               measurement_unit='г')
+                    for number in range(100)
+                ],
+                ignore_conflicts=True)
+            ingredient_ids = list(
+                Ingredient.objects.values_list('id', flat=True))
+
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            [
+                User(username=f'{prefix}_{number}',
+                     email=f'{prefix}_{number}@example.com',
+                     first_name='Имя', last_name='Фамилия',
+                     password=password)
+                for number in range(options['users'])
+            ],
+            batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}_').values_list('id', flat=True))
+
+        image = placeholder_image()
+        Recipe.objects.bulk_create(
+            [
+                Recipe(author_id=rng.choice(user_ids),
+                       name=f'Рецепт {number}',
+                       text='Синтетический рецепт для нагрузочных тестов.',
+                       image=image,
+                       cooking_time=rng.randint(1, 120))
+                for number in range(options['recipes'])
+            ],
+            batch_size=BATCH_SIZE)
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=user_ids).values_list('id', flat=True))
+
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rng.sample(
+                    tag_ids, rng.randint(1, len(tag_ids)))
+            ],
+            batch_size=BATCH_SIZE)
+        per_recipe = min(
+            options['ingredients_per_recipe'], len(ingredient_ids))
+        RecipeIngredients.objects.bulk_create(
+            [
+                RecipeIngredients(recipe_id=recipe_id,
+                                  ingredient_id=ingredient_id,
+                                  amount=rng.randint(1, 500))
+                for recipe_id in recipe_ids
+                for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+            ],
+            batch_size=BATCH_SIZE)
+
+        for model, owner, target, count, targets in (
+            (Favorite, 'user_id', 'recipe_id',
+             options['favorites'], recipe_ids),
+            (GroceryList, 'user_id', 'recipe_id',
+             options['carts'], recipe_ids),
+            (Subscribe, 'subscriber_id', 'author_id',
+             options['subscriptions'], user_ids),
+        ):
+            model.objects.bulk_create(
+                [
+                    model(**{owner: owner_id, target: target_id})
+                    for owner_id, target_id in random_pairs(
+                        rng, user_ids, targets, count)
+                    if model is not Subscribe or owner_id != target_id
+                ],
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True)
+
+        # bulk_create не обновляет денормализованные счётчики.
+        call_command('recount', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            'Создано пользователей: {0}, рецептов: {1} за {2:.1f} с. '
+            'Пароль пользователей: {3}.'.format(
+                len(user_ids), len(recipe_ids),
+                time.monotonic() - start, PASSWORD)))
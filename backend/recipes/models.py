@@ -2,7 +2,8 @@ from colorfield.fields import ColorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
-from users.models import User
+from recipes.images import image_storage
+from users.models import CountersMixin, User
 
 
 class Tag(models.Model):
@@ -56,9 +57,11 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецепта."""
 
+    counter_fields = ('favorites_count', 'carts_count')
+
     name = models.CharField(
         max_length=200,
         verbose_name='Название')
@@ -80,6 +83,7 @@ class Recipe(models.Model):
         verbose_name='Тэги')
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=image_storage,
         null=False,
         default=None,
         verbose_name='Фото')
@@ -91,11 +95,30 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата рецепта')
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном')
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = (
+            models.Index(
+                fields=('-pub_date',),
+                name='recipe_pub_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'),
+            models.Index(
+                fields=('-favorites_count', '-pub_date'),
+                name='recipe_popular_idx'),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -0,0 +1,28 @@
+import logging
+
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Триграммные индексы по UPPER(name) обслуживают запросы icontains
+# и istartswith, которые Django строит как UPPER(name) LIKE UPPER(...).
+TRIGRAM_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+    'ON recipes_recipe USING gin (UPPER(name) gin_trgm_ops)',
+)
+
+
+def create_trigram_indexes(sender, using='default', **kwargs):
+    """Создание индексов pg_trgm после миграций (только PostgreSQL)."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with connection.cursor() as cursor:
+            for sql in TRIGRAM_INDEXES:
+                cursor.execute(sql)
+    except DatabaseError as error:
+        logger.warning('Триграммные индексы не созданы: %s', error)
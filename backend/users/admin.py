@@ -6,7 +6,7 @@ from users.models import Subscribe, User
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'first_name', 'last_name',
-                    'email', 'is_staff')
+                    'email', 'is_staff', 'recipes_count', 'subscribers_count')
     list_filter = ('email', 'username')
 
 
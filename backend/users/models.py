@@ -2,9 +2,31 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Полное сохранение модели без полей-счётчиков.
+
+    Счётчики меняются только запросами с F() (api.utils.change_counter).
+    Экземпляр, загруженный в начале запроса или взятый из кэша, не должен
+    перезаписать их старыми значениями.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя."""
 
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     email = models.EmailField(
         max_length=254,
         verbose_name='Почта')
@@ -20,6 +42,14 @@ class User(AbstractUser):
         verbose_name='Фамилия')
     password = models.CharField(
         max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков')
 
     class Meta:
         verbose_name = 'Пользователь'